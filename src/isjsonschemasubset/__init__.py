@@ -1,7 +1,19 @@
+import dataclasses
 from dataclasses import dataclass
-import json
+import functools
 from pathlib import Path
-from typing import Iterator, Literal as L, assert_never, overload
+from types import MappingProxyType
+from typing import (
+    Annotated,
+    Any,
+    Callable,
+    ClassVar,
+    Iterator,
+    Literal as L,
+    Mapping,
+    cast,
+    overload,
+)
 
 import pydantic
 
@@ -10,6 +22,8 @@ import pydantic
 
 
 class Base(pydantic.BaseModel):
+    model_config = pydantic.ConfigDict(frozen=True, extra="ignore", defer_build=True)
+
     title: str = ""
     description: str = ""
 
@@ -79,10 +93,43 @@ class Ref(Base):
     )
 
 
-Value = Null | Boolean | Integer | Number | String | Array | Object | AllOf | AnyOf | Ref
+def _value_tag(v: Any) -> str | None:
+    """Pick the `Value` variant up front rather than trying each in turn."""
+    if isinstance(v, dict):
+        if "$ref" in v or "ref" in v:
+            return "ref"
+        if "allOf" in v or "all_of" in v:
+            return "allOf"
+        if "anyOf" in v or "any_of" in v:
+            return "anyOf"
+        return v.get("type")
+    if isinstance(v, Ref):
+        return "ref"
+    if isinstance(v, AllOf):
+        return "allOf"
+    if isinstance(v, AnyOf):
+        return "anyOf"
+    return getattr(v, "type", None)
+
+
+Value = Annotated[
+    Annotated[Null, pydantic.Tag("null")]
+    | Annotated[Boolean, pydantic.Tag("boolean")]
+    | Annotated[Integer, pydantic.Tag("integer")]
+    | Annotated[Number, pydantic.Tag("number")]
+    | Annotated[String, pydantic.Tag("string")]
+    | Annotated[Array, pydantic.Tag("array")]
+    | Annotated[Object, pydantic.Tag("object")]
+    | Annotated[AllOf, pydantic.Tag("allOf")]
+    | Annotated[AnyOf, pydantic.Tag("anyOf")]
+    | Annotated[Ref, pydantic.Tag("ref")],
+    pydantic.Discriminator(_value_tag),
+]
 
 
 class JSONSchema(pydantic.BaseModel):
+    model_config = pydantic.ConfigDict(frozen=True, extra="ignore", defer_build=True)
+
     type: L["object"]
     title: str
     definitions: dict[str, Value] = pydantic.Field(
@@ -94,83 +141,365 @@ class JSONSchema(pydantic.BaseModel):
     required: list[str] = pydantic.Field(default_factory=list)
 
 
+_MODELS: tuple[type[pydantic.BaseModel], ...] = (
+    Null,
+    Boolean,
+    Integer,
+    Number,
+    String,
+    Array,
+    Object,
+    AllOf,
+    AnyOf,
+    Ref,
+    JSONSchema,
+)
+for _model in _MODELS:
+    _model.model_rebuild()
+
+
+_JSON_DICT = pydantic.TypeAdapter(dict[str, Any])
+
+
+def _sort_keys(o: Any) -> Any:
+    if isinstance(o, dict):
+        return {k: _sort_keys(o[k]) for k in sorted(o)}
+    if isinstance(o, list):
+        return [_sort_keys(v) for v in o]
+    return o
+
+
 def dump(cls: type[pydantic.BaseModel], p: Path) -> None:
-    s = json.dumps(cls.model_json_schema(), sort_keys=True, indent=4)
-    p.write_text(s)
+    # Unlike json.dumps, non-ASCII is written as raw UTF-8 rather than \uXXXX.
+    p.write_bytes(_JSON_DICT.dump_json(_sort_keys(cls.model_json_schema()), indent=4))
+    # A rewrite can land within the filesystem's mtime resolution.
+    _load.cache_clear()
+
+
+# Resolved schemas: plain slotted dataclasses that `issubset` walks, pydantic
+# is only used to parse the JSONSchema at the boundary.
+
+
+@dataclass(slots=True, frozen=True)
+class NullD:
+    kind: ClassVar[int] = 0  # index into _HANDLERS, cheaper than isinstance chains
+    name: ClassVar[str] = "Null"
+    title: str = ""
+    description: str = ""
+
+
+@dataclass(slots=True, frozen=True)
+class BooleanD:
+    kind: ClassVar[int] = 1
+    name: ClassVar[str] = "Boolean"
+    title: str = ""
+    description: str = ""
+    default: bool | None = None
+
+
+@dataclass(slots=True, frozen=True)
+class IntegerD:
+    kind: ClassVar[int] = 2
+    name: ClassVar[str] = "Integer"
+    title: str = ""
+    description: str = ""
+    enum: tuple[int, ...] | None = None
+    default: int | None = None
+
+
+@dataclass(slots=True, frozen=True)
+class NumberD:
+    kind: ClassVar[int] = 3
+    name: ClassVar[str] = "Number"
+    title: str = ""
+    description: str = ""
+    enum: tuple[float, ...] | None = None
+    default: float | None = None
+
+
+@dataclass(slots=True, frozen=True)
+class StringD:
+    kind: ClassVar[int] = 4
+    name: ClassVar[str] = "String"
+    title: str = ""
+    description: str = ""
+    enum: tuple[str, ...] | None = None
+    format: str | None = None
+    default: str | None = None
+    enum_set: frozenset[str] | None = dataclasses.field(
+        default=None, compare=False, repr=False
+    )
+
+
+@dataclass(slots=True, frozen=True)
+class ArrayD:
+    kind: ClassVar[int] = 5
+    name: ClassVar[str] = "Array"
+    items: "ValueD"
+    title: str = ""
+    description: str = ""
+
+
+@dataclass(slots=True, frozen=True)
+class ObjectD:
+    kind: ClassVar[int] = 6
+    name: ClassVar[str] = "Object"
+    properties: Mapping[str, "ValueD"] = dataclasses.field(
+        default_factory=lambda: MappingProxyType({})
+    )
+    required: tuple[str, ...] = ()
+    title: str = ""
+    description: str = ""
+    required_set: frozenset[str] = dataclasses.field(
+        default=frozenset(), compare=False, repr=False
+    )
+
+
+@dataclass(slots=True, frozen=True)
+class AnyOfD:
+    kind: ClassVar[int] = 7
+    name: ClassVar[str] = "AnyOf"
+    any_of: tuple["ValueD", ...]
+    title: str = ""
+    description: str = ""
+    default: None | bool | int | float | str = None
+
+
+ValueD = NullD | BooleanD | IntegerD | NumberD | StringD | ArrayD | ObjectD | AnyOfD
+
+
+def _object_d(properties: dict[str, ValueD], required: list[str]) -> ObjectD:
+    return ObjectD(
+        properties=MappingProxyType(properties),
+        required=tuple(required),
+        required_set=frozenset(required),
+    )
 
 
 @overload
-def resolve(o: JSONSchema) -> Object:
+def resolve(o: JSONSchema) -> ObjectD:
     ...
 
 
 @overload
-def resolve(o: Value, definitions: dict[str, Value]) -> Value:
+def resolve(
+    o: Value,
+    definitions: dict[str, Value],
+    memo: dict[str, ValueD] | None = None,
+) -> ValueD:
     ...
 
 
-def resolve(o: JSONSchema | Value, definitions: dict[str, Value] | None = None) -> Value:
-    """Recursively inline the definitions from the JSONSchema."""
+def resolve(
+    o: JSONSchema | Value,
+    definitions: dict[str, Value] | None = None,
+    memo: dict[str, ValueD] | None = None,
+) -> ValueD:
+    """Recursively inline the definitions from the JSONSchema.
+
+    Returns the tree of resolved dataclasses that `issubset` compares.
+    `memo` maps definition names to their resolved value, so each `$ref`d
+    definition is only resolved once per top-level call. `resolving` holds the
+    definitions part way through being resolved, to catch recursive schemas.
+    """
     if definitions is None:
         assert isinstance(o, JSONSchema)
         definitions = o.definitions
+    if memo is None:
+        memo = {}
+    resolving: set[str] = set()
 
     if isinstance(o, JSONSchema):
-        return Object(
-            type="object",
-            properties={k: resolve(v, definitions) for k, v in o.properties.items()},
-            required=o.required,
-        )
-    if isinstance(o, (Null, Boolean, Integer, Number, String)):
-        return o
-    if isinstance(o, Array):
-        return Array(type="array", items=resolve(o.items, definitions))
-    if isinstance(o, Object):
-        properties = None
-        if o.properties is not None:
-            properties = {k: resolve(v, definitions) for k, v in o.properties.items()}
-        return Object(
-            type="object",
-            properties=properties,
-            required=o.required,
-        )
-    if isinstance(o, AllOf):
-        if len(o.all_of) != 1 or not isinstance(o.all_of[0], Ref):
-            raise NotImplementedError("Only support AllOf poiting to one reference")
-        _, __, name = o.all_of[0].ref.split("/")
-        v = definitions[name]
-        if o.default is not None:
-            v.default = o.default
-        return v
-    if isinstance(o, AllOf):
-        raise NotImplementedError("Only support AllOf poiting to one reference")
-    if isinstance(o, AnyOf):
-        return AnyOf(
-            any_of=[resolve(v, definitions) for v in o.any_of],
-            default=o.default,
+        return _object_d(
+            {
+                k: _resolve(v, definitions, memo, resolving)
+                for k, v in o.properties.items()
+            },
+            o.required,
         )
-    if isinstance(o, Ref):
-        _, __, name = o.ref.split("/")
-        return resolve(definitions[name], definitions)
+    return _resolve(o, definitions, memo, resolving)
+
+
+def _resolve(
+    o: Value,
+    definitions: dict[str, Value],
+    memo: dict[str, ValueD],
+    resolving: set[str],
+) -> ValueD:
+    return _RESOLVE[type(o)](o, definitions, memo, resolving)
+
+
+def _resolve_null(
+    o: Null,
+    definitions: dict[str, Value],
+    memo: dict[str, ValueD],
+    resolving: set[str],
+) -> ValueD:
+    return NullD(o.title, o.description)
+
+
+def _resolve_boolean(
+    o: Boolean,
+    definitions: dict[str, Value],
+    memo: dict[str, ValueD],
+    resolving: set[str],
+) -> ValueD:
+    return BooleanD(o.title, o.description, o.default)
+
+
+def _resolve_integer(
+    o: Integer,
+    definitions: dict[str, Value],
+    memo: dict[str, ValueD],
+    resolving: set[str],
+) -> ValueD:
+    enum = None if o.enum is None else tuple(o.enum)
+    return IntegerD(o.title, o.description, enum, o.default)
+
+
+def _resolve_number(
+    o: Number,
+    definitions: dict[str, Value],
+    memo: dict[str, ValueD],
+    resolving: set[str],
+) -> ValueD:
+    enum = None if o.enum is None else tuple(o.enum)
+    return NumberD(o.title, o.description, enum, o.default)
+
+
+def _resolve_string(
+    o: String,
+    definitions: dict[str, Value],
+    memo: dict[str, ValueD],
+    resolving: set[str],
+) -> ValueD:
+    if o.enum is None:
+        return StringD(o.title, o.description, None, o.format, o.default)
+    return StringD(
+        o.title,
+        o.description,
+        tuple(o.enum),
+        o.format,
+        o.default,
+        frozenset(o.enum),
+    )
+
+
+def _resolve_array(
+    o: Array,
+    definitions: dict[str, Value],
+    memo: dict[str, ValueD],
+    resolving: set[str],
+) -> ValueD:
+    return ArrayD(_resolve(o.items, definitions, memo, resolving))
+
+
+def _resolve_object(
+    o: Object,
+    definitions: dict[str, Value],
+    memo: dict[str, ValueD],
+    resolving: set[str],
+) -> ValueD:
+    return _object_d(
+        {k: _resolve(v, definitions, memo, resolving) for k, v in o.properties.items()},
+        o.required,
+    )
 
-    assert_never(o)
+
+def _resolve_all_of(
+    o: AllOf,
+    definitions: dict[str, Value],
+    memo: dict[str, ValueD],
+    resolving: set[str],
+) -> ValueD:
+    if len(o.all_of) != 1 or not isinstance(o.all_of[0], Ref):
+        raise NotImplementedError("Only support AllOf poiting to one reference")
+    v = _resolve_ref(o.all_of[0], definitions, memo, resolving)
+    if o.default is not None and isinstance(
+        v, (BooleanD, IntegerD, NumberD, StringD, AnyOfD)
+    ):
+        v = dataclasses.replace(v, default=o.default)  # type: ignore[arg-type]
+    return v
+
+
+def _resolve_any_of(
+    o: AnyOf,
+    definitions: dict[str, Value],
+    memo: dict[str, ValueD],
+    resolving: set[str],
+) -> ValueD:
+    return AnyOfD(
+        any_of=tuple(_resolve(v, definitions, memo, resolving) for v in o.any_of),
+        default=o.default,
+    )
 
 
-@dataclass
+def _resolve_ref(
+    o: Ref,
+    definitions: dict[str, Value],
+    memo: dict[str, ValueD],
+    resolving: set[str],
+) -> ValueD:
+    names: list[str] = []
+    v: Value = o
+    while isinstance(v, Ref):
+        prefix, _, name = v.ref.rpartition("/")
+        if prefix not in ("#/$defs", "#/definitions"):
+            raise NotImplementedError(f"Only support local definitions: {v.ref}")
+        if name in memo:
+            resolved = memo[name]
+            break
+        if name in resolving:
+            raise NotImplementedError(f"Circular reference: {name}")
+        names.append(name)
+        resolving.add(name)
+        v = definitions[name]
+    else:
+        resolved = _resolve(v, definitions, memo, resolving)
+    for name in names:
+        memo[name] = resolved
+        resolving.discard(name)
+    return resolved
+
+
+# Keyed on the exact type, `Value` is a closed union so subclasses can't occur.
+_RESOLVE: dict[
+    type, Callable[[Any, dict[str, Value], dict[str, ValueD], set[str]], ValueD]
+] = {
+    Null: _resolve_null,
+    Boolean: _resolve_boolean,
+    Integer: _resolve_integer,
+    Number: _resolve_number,
+    String: _resolve_string,
+    Array: _resolve_array,
+    Object: _resolve_object,
+    AllOf: _resolve_all_of,
+    AnyOf: _resolve_any_of,
+    Ref: _resolve_ref,
+}
+
+
+@dataclass(slots=True, frozen=True)
 class Error:
     path: tuple[str, ...]
-    a: Value
-    b: Value
+    a: ValueD = dataclasses.field(hash=False)  # may hold unhashable ObjectDs
+    b: ValueD = dataclasses.field(hash=False)
     msg: str = "Types don't match"
+    path_str: str = dataclasses.field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "path_str", ".".join(self.path))
 
     def __str__(self) -> str:
-        return (
-            f"At .{'.'.join(self.path)} {self.msg} - "
-            f"a: {self.a.__class__.__name__} b: {self.b.__class__.__name__}"
-        )
+        return f"At .{self.path_str} {self.msg} - a: {self.a.name} b: {self.b.name}"
+
 
+# A comparison to make (with the path segment to descend into, if any), an
+# error to yield, or None to pop the last path segment once a subtree is done.
+_Work = tuple[ValueD, ValueD, str | None] | Error | None
 
-def issubset(a: Value, b: Value, path: tuple[str, ...] = ()) -> Iterator[Error]:
+
+def issubset(a: ValueD, b: ValueD, path: tuple[str, ...] = ()) -> Iterator[Error]:
     """Yield errors if the type `a` is not a subset of `b`.
 
     In this context, "is a subset of" means that for the corresponding
@@ -181,52 +510,121 @@ def issubset(a: Value, b: Value, path: tuple[str, ...] = ()) -> Iterator[Error]:
     We would not get an error. This is very important when parsing data
     from JSON columns in the database.
     """
-    if isinstance(a, AnyOf):  # if any options have any errors
-        for a_value in a.any_of:
-            yield from issubset(a_value, b, path)
-    elif isinstance(b, AnyOf):  # if all options have any errors
-        all_errors = [list(issubset(a, b_value, path)) for b_value in b.any_of]
-        if all(errors for errors in all_errors):
-            for errors in all_errors:
-                yield from iter(errors)
-    elif isinstance(a, String):
-        if not isinstance(b, String):
-            yield Error(path, a, b)
-        elif a.format != b.format:
-            yield Error(path, a, b, "String formats do not match")
-        elif b.enum is not None:
-            if a.enum is None:
-                yield Error(path, a, b, "Cannot fit any string into an Enum")
-            elif set(a.enum) - set(b.enum):
-                keys_in_a_not_b = ", ".join(set(a.enum) - set(b.enum))
-                yield Error(path, a, b, f"Following keys not in a: {keys_in_a_not_b}")
-    elif isinstance(a, (Null, Boolean, Integer, Number)):
-        if type(a) != type(b):
-            yield Error(path, a, b)
-    elif isinstance(a, Array):
-        if not isinstance(b, Array):
-            yield Error(path, a, b)
-        else:
-            yield from issubset(a.items, b.items, path + ("[]",))
-    elif isinstance(a, Object):
-        if not isinstance(b, Object):
-            yield Error(path, a, b)
+    current = list(path)
+    stack: list[_Work] = [(a, b, None)]
+    while stack:
+        item = stack.pop()
+        if item is None:
+            current.pop()
+        elif isinstance(item, Error):
+            yield item
         else:
-            for b_key, b_value in b.properties.items():
-                if b_key in b.required and b_key not in a.properties:
-                    yield Error(
-                        path + (b_key,),
-                        a,
-                        b,
-                        f"Key: {b_key} not in {', '.join(a.properties)}",
-                    )
-                if b_key in a.properties:
-                    a_value = a.properties[b_key]
-                    yield from issubset(a_value, b_value, path + (b_key,))
-    else:
-        yield Error(path, a, b, "Unknown type")
+            a_item, b_item, key = item
+            if key is not None:
+                current.append(key)
+                stack.append(None)
+            _issubset_step(a_item, b_item, current, stack)
+
 
+def _issubset_step(a: ValueD, b: ValueD, path: list[str], stack: list[_Work]) -> None:
+    """Compare one pair of nodes, pushing errors and child comparisons.
 
-def load(p: Path) -> Object:
-    schema = JSONSchema(**json.loads(p.read_bytes()))
+    Work is pushed in reverse so that errors come out in depth-first order.
+    `path` is shared and mutated by the caller, errors take a copy.
+    """
+    if a is b:  # same node, eg. two `$ref`s to one definition in a schema
+        return
+    todo: list[_Work] = []
+    if a.kind == AnyOfD.kind:  # if any options have any errors
+        for a_value in cast(AnyOfD, a).any_of:
+            todo.append((a_value, b, None))
+    elif b.kind == AnyOfD.kind:  # if all options have any errors
+        collected: list[Error] = []
+        for b_value in cast(AnyOfD, b).any_of:
+            errors = list(issubset(a, b_value, tuple(path)))
+            if not errors:  # `a` fits this option, no need to try the rest
+                break
+            collected.extend(errors)
+        else:
+            todo.extend(collected)
+    else:
+        _HANDLERS[a.kind](a, b, path, todo)
+    stack.extend(reversed(todo))
+
+
+def _cmp_scalar(a: ValueD, b: ValueD, path: list[str], todo: list[_Work]) -> None:
+    if a.kind != b.kind:
+        todo.append(Error(tuple(path), a, b))
+
+
+def _cmp_string(a: StringD, b: ValueD, path: list[str], todo: list[_Work]) -> None:
+    if a.kind != b.kind:
+        todo.append(Error(tuple(path), a, b))
+        return
+    b = cast(StringD, b)
+    if a.format != b.format:
+        todo.append(Error(tuple(path), a, b, "String formats do not match"))
+    elif b.enum_set is not None:
+        if a.enum_set is None:
+            todo.append(Error(tuple(path), a, b, "Cannot fit any string into an Enum"))
+        elif missing := a.enum_set - b.enum_set:
+            keys_in_a_not_b = ", ".join(sorted(missing))
+            todo.append(
+                Error(tuple(path), a, b, f"Following keys not in a: {keys_in_a_not_b}")
+            )
+
+
+def _cmp_array(a: ArrayD, b: ValueD, path: list[str], todo: list[_Work]) -> None:
+    if a.kind != b.kind:
+        todo.append(Error(tuple(path), a, b))
+        return
+    b = cast(ArrayD, b)
+    todo.append((a.items, b.items, "[]"))
+
+
+def _cmp_object(a: ObjectD, b: ValueD, path: list[str], todo: list[_Work]) -> None:
+    if a.kind != b.kind:
+        todo.append(Error(tuple(path), a, b))
+        return
+    b = cast(ObjectD, b)
+    for b_key, b_value in b.properties.items():
+        if b_key in b.required_set and b_key not in a.properties:
+            todo.append(
+                Error(
+                    (*path, b_key),
+                    a,
+                    b,
+                    f"Key: {b_key} not in {', '.join(a.properties)}",
+                )
+            )
+        if b_key in a.properties:
+            a_value = a.properties[b_key]
+            todo.append((a_value, b_value, b_key))
+
+
+def _cmp_unknown(a: ValueD, b: ValueD, path: list[str], todo: list[_Work]) -> None:
+    todo.append(Error(tuple(path), a, b, "Unknown type"))
+
+
+# Indexed by `kind`, AnyOfD is handled before dispatch.
+_HANDLERS: list[Callable[[Any, ValueD, list[str], list[_Work]], None]] = [
+    _cmp_scalar,  # NullD
+    _cmp_scalar,  # BooleanD
+    _cmp_scalar,  # IntegerD
+    _cmp_scalar,  # NumberD
+    _cmp_string,  # StringD
+    _cmp_array,  # ArrayD
+    _cmp_object,  # ObjectD
+    _cmp_unknown,  # AnyOfD
+]
+
+
+def load(p: Path) -> ObjectD:
+    return _load(p, p.stat().st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=256)
+def _load(p: Path, mtime_ns: int) -> ObjectD:
+    """Cached on the modification time so rewritten files are reloaded."""
+    schema = JSONSchema.model_validate_json(p.read_bytes())
     return resolve(schema)
@@ -2,7 +2,8 @@ import datetime as dt
 import enum
 from pathlib import Path
 
-from isjsonschemasubset import Object, dump, issubset, load
+from isjsonschemasubset import JSONSchema, ObjectD, dump, issubset, load, resolve
+import pytest
 from pydantic import BaseModel
 
 
@@ -52,6 +53,24 @@ class IntOrStrNested(BaseModel):
     b: IntOrStr | None
 
 
+class StrNestedTwice(BaseModel):
+    b: StrOnly
+    c: StrOnly
+
+
+class Tree(BaseModel):
+    children: list["Tree"]
+
+
+class Forest(BaseModel):
+    tree: Tree
+
+
+class IntNestedAndStr(BaseModel):
+    b: IntOnly
+    c: str
+
+
 class StrNoDefault(BaseModel):
     a: str
     b: float
@@ -78,6 +97,13 @@ class BC(enum.Enum):
     c = "c"
 
 
+class DCBA(enum.Enum):
+    d = "d"
+    c = "c"
+    b = "b"
+    a = "a"
+
+
 class EnumAB(BaseModel):
     choices: AB
 
@@ -90,6 +116,10 @@ class EnumBC(BaseModel):
     choices: BC
 
 
+class EnumDCBA(BaseModel):
+    choices: DCBA
+
+
 class X(BaseModel):
     a: str
 
@@ -114,13 +144,20 @@ class UnionYZ(BaseModel):
     choices: Y | Z
 
 
-def schema(cls: type[BaseModel]) -> Object:
+def schema(cls: type[BaseModel]) -> ObjectD:
     cls_name = cls.__name__
     p = TEST_DIR / f"{cls_name}.json"
     dump(cls, p)
     return load(p)
 
 
+def test_load_cached_read_only() -> None:
+    resolved = schema(StrNested)
+    assert load(TEST_DIR / "StrNested.json") is resolved
+    with pytest.raises(TypeError):
+        resolved.properties["c"] = resolved.properties["b"]  # type: ignore[index]
+
+
 def test_basic() -> None:
     actual = [str(e) for e in issubset(schema(StrOnly), schema(StrOnly))]
     expected: list[str] = []
@@ -163,6 +200,45 @@ def test_nested_errors() -> None:
     assert actual == expected
 
 
+def test_nested_shared_ref() -> None:
+    resolved = schema(StrNestedTwice)
+    assert resolved.properties["b"] is resolved.properties["c"]
+
+
+def test_nested_ref_unsupported() -> None:
+    unresolved = JSONSchema.model_validate(
+        {
+            "type": "object",
+            "title": "NestedRef",
+            "$defs": {"bar": {"type": "string"}},
+            "properties": {"a": {"$ref": "#/$defs/Foo/bar"}},
+        }
+    )
+    with pytest.raises(NotImplementedError):
+        resolve(unresolved)
+
+
+def test_identical_nodes() -> None:
+    resolved = schema(StrNestedTwice)
+    assert list(issubset(resolved, resolved)) == []
+    b, c = resolved.properties["b"], resolved.properties["c"]
+    assert list(issubset(b, c)) == []
+
+
+def test_recursive_unsupported() -> None:
+    with pytest.raises(NotImplementedError, match="Circular reference: Tree"):
+        schema(Forest)
+
+
+def test_nested_errors_order() -> None:
+    actual = [str(e) for e in issubset(schema(StrNested), schema(IntNestedAndStr))]
+    expected = [
+        "At .b.a Types don't match - a: String b: Integer",
+        "At .c Key: c not in b - a: Object b: Object",
+    ]
+    assert actual == expected
+
+
 def test_nested_union_errors() -> None:
     actual = [str(e) for e in issubset(schema(StrOrNoneNested), schema(IntOrStrNested))]
     expected = [
@@ -179,6 +255,11 @@ def test_missing_key() -> None:
     assert actual == expected
 
 
+def test_missing_key_hashable() -> None:
+    errors = list(issubset(schema(StrOnly), schema(StrNoDefault)))
+    assert len(set(errors + errors)) == 1
+
+
 def test_missing_key_with_default() -> None:
     actual = [str(e) for e in issubset(schema(StrOnly), schema(StrAndDefault))]
     expected: list[str] = []
@@ -203,6 +284,12 @@ def test_enum_superset() -> None:
     assert actual == expected
 
 
+def test_enum_superset_sorted() -> None:
+    actual = [str(e) for e in issubset(schema(EnumDCBA), schema(EnumAB))]
+    expected = ["At .choices Following keys not in a: c, d - a: String b: String"]
+    assert actual == expected
+
+
 def test_enum_intersection() -> None:
     actual = [str(e) for e in issubset(schema(EnumAB), schema(EnumBC))]
     expected = ["At .choices Following keys not in a: a - a: String b: String"]
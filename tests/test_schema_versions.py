@@ -1,6 +1,6 @@
 from pathlib import Path
 
-from isjsonschemasubset import JSONSchema, Object, dump, issubset, load, resolve
+from isjsonschemasubset import JSONSchema, ObjectD, dump, issubset, load, resolve
 import pytest
 from pydantic import BaseModel
 
@@ -39,7 +39,7 @@ def max_version_in_dir(cls_dir: Path) -> int:
 def test_versions(cls: type[BaseModel]) -> None:
     cls_dir = cls_to_versions_dir(cls)
     max_version = max_version_in_dir(cls_dir)
-    previous_schema: Object | None = None
+    previous_schema: ObjectD | None = None
     if max_version > 0:
         previous_schema = load(cls_dir / version_filename(max_version))
 
@@ -49,8 +49,9 @@ def test_versions(cls: type[BaseModel]) -> None:
         dump(cls, cls_dir / version_filename(max_version + 1))
 
     schema_files = sorted(cls_dir.glob("*.json"))
+    schemas = {f: load(f) for f in schema_files}
     for a, b in zip(schema_files, schema_files[1:]):
-        all_errors = "\n\n".join(str(e) for e in issubset(load(a), load(b)))
+        all_errors = "\n\n".join(str(e) for e in issubset(schemas[a], schemas[b]))
         if all_errors:
             pytest.fail(
                 f"Backwards compatible schema failure between {a} and {b}:\n{all_errors}"